@@ -4,19 +4,73 @@ An AI player for Othello.
 
 import random
 import sys
+import threading
 import time
 
 # You can use the functions in othello_shared to write your AI
-from othello_shared import find_lines, get_possible_moves, get_score, play_move
+from othello_shared import find_flips_bb, get_bitboards, get_region_masks, get_possible_moves_bb, get_score_bb, iter_squares, parse_bitboards, play_move_bb
 
-cached_states = {}
+# Transposition table: a fixed-size list indexed by the low bits of the
+# Zobrist hash h. A slot is None or holds (h, depth, value, flag, best_move).
+# depth is the remaining depth limit the value was searched with, and flag
+# tells whether value is the exact value or only a lower/upper bound on it.
+# The table is kept for the whole game, so later moves reuse earlier searches.
+TT_BITS = 20
+TT_MASK = (1 << TT_BITS) - 1
+cached_states = [None] * (1 << TT_BITS)
+EXACT, LOWER, UPPER = 0, 1, 2
+INF = float('inf')
 
 def eprint(*args, **kwargs): #you can use this for debugging, as it will print to sterr and not stdout
     print(*args, file=sys.stderr, **kwargs)
-    
+
+def clear_cached_states():
+    cached_states[:] = [None] * (1 << TT_BITS)
+
+# Store a search result in its slot. A slot that holds the same state searched
+# to a greater depth is kept, any other entry is replaced.
+def store_state(h, limit, value, flag, move):
+    slot = h & TT_MASK
+    entry = cached_states[slot]
+    if entry is None or entry[0] != h or entry[1] <= limit:
+        cached_states[slot] = (h, limit, value, flag, move)
+
+# The search works on bitboards (see othello_shared). Nodes only take plain
+# integers: own and opp are the disks of the player to move and of the other
+# player, so no tuples are built and no color checks are made per node.
+# States are identified by their Zobrist hash h: the XOR of a random key for
+# every disk on the board, and of SIDE_KEY when light is to move. Playing a
+# move only XORs in the keys of the squares that changed.
+SIDE_KEY = random.getrandbits(64)
+zobrist_keys = {}
+
+# Return the Zobrist keys of a board of dimension n: keys[1][square] and
+# keys[2][square] are the keys of a dark and a light disk on square, and
+# keys[0][square] is their XOR, which flips a disk from one color to the other
+def get_zobrist_keys(n):
+    if n not in zobrist_keys:
+        dark_keys = [random.getrandbits(64) for _ in range(n * n)]
+        light_keys = [random.getrandbits(64) for _ in range(n * n)]
+        flip_keys = [d ^ l for d, l in zip(dark_keys, light_keys)]
+        zobrist_keys[n] = (flip_keys, dark_keys, light_keys)
+    return zobrist_keys[n]
+
+# Compute the Zobrist hash of a state from scratch
+def get_hash(dark, light, n, color):
+    _, dark_keys, light_keys = get_zobrist_keys(n)
+    h = SIDE_KEY if color == 2 else 0
+    for square in iter_squares(dark):
+        h ^= dark_keys[square]
+    for square in iter_squares(light):
+        h ^= light_keys[square]
+    return h
+
 # Method to compute utility value of terminal state
+# Leaves are by far the most common nodes, so the search inlines the same
+# difference on bitboards, own.bit_count() - opp.bit_count(), instead of
+# calling this, and the heavier compute_heuristic below is never used there.
 def compute_utility(board, color):
-    dark_score, light_score = get_score(board)
+    dark_score, light_score = get_score_bb(*get_bitboards(board))
     if color == 1:
         return dark_score - light_score
     elif color == 2:
@@ -25,15 +79,29 @@ def compute_utility(board, color):
         eprint("Invalid color")
         return 0
 
+# Return the (rim, corner) masks used by compute_heuristic_bb: rim holds every
+# square on the border of the board, corners included
+def get_stability_masks(n):
+    if n not in stability_masks:
+        corner, edge, _ = get_region_masks(n)
+        stability_masks[n] = (corner | edge, corner)
+    return stability_masks[n]
+
+stability_masks = {}
+
 # Better heuristic value of board
 # The implementation of this heuristic is based on the following website: 
 # https://kartikkukreja.wordpress.com/2013/03/30/heuristic-function-for-reversiothello/
 def compute_heuristic(board, color):
-    n = len(board)
+    dark, light = get_bitboards(board)
+    return compute_heuristic_bb(dark, light, len(board), color)
+
+# Same as compute_heuristic, on a board of dimension n given as bitboards
+def compute_heuristic_bb(dark, light, n, color):
     
     # Coin parity
     # Difference in the number of current scores
-    dark_score, light_score = get_score(board)
+    dark_score, light_score = get_score_bb(dark, light)
     coin_parity = dark_score - light_score
     
     # Stability
@@ -41,28 +109,12 @@ def compute_heuristic(board, color):
     # Stable: A disc that cannot be flipped (corners are always stable)
     # Semi-stable: A disc that can be flipped, but will not be flipped in the next move
     # Unstable: A disc that can be flipped in the next move
-    dark_stable = 0
-    light_stable = 0
-    for i in range(n):
-        for j in range(n):
-            # Corners are always stable
-            if [i, j] in [[0, 0], [0, n-1], [n-1, 0], [n-1, n-1]]:
-                if board[i][j] == 1:
-                    dark_stable += 5
-                elif board[i][j] == 2:
-                    light_stable += 5
-            # Edges are semi-stable
-            elif i == 0 or i == n-1 or j == 0 or j == n-1:
-                if board[i][j] == 1:
-                    dark_stable += 2
-                elif board[i][j] == 2:
-                    light_stable += 2
-            # Other placements are considered unstable
-            else:
-                if board[i][j] == 1:
-                    dark_stable += 1
-                elif board[i][j] == 2:
-                    light_stable += 1
+    # Corners are worth 5, edges 2 and other placements 1: every disk counts 1,
+    # which the scores above already count, plus 1 more on the rim and 3 more
+    # in a corner
+    rim, corner = get_stability_masks(n)
+    dark_stable = dark_score + (dark & rim).bit_count() + 3 * (dark & corner).bit_count()
+    light_stable = light_score + (light & rim).bit_count() + 3 * (light & corner).bit_count()
     stable = dark_stable - light_stable
     
     # Weighted sum of the four components
@@ -73,46 +125,51 @@ def compute_heuristic(board, color):
     elif color == 2:
         return -utility
 
+# The searches recurse once per ply. Without a depth limit a large board can
+# need more plies than Python's default recursion limit, so raise it to fit.
+def ensure_recursion_limit(limit):
+    if sys.getrecursionlimit() < limit + 100:
+        sys.setrecursionlimit(limit + 100)
+
+# Convert a square index back to the (column, row) tuple expected by the manager
+def to_move(square, n):
+    if square is None:
+        return None
+    return square % n, square // n
+
 ############ MINIMAX ###############################
-def minimax_min_node(board, color, limit, caching = 0):
-    
-    if caching == 1 and (board, color) in cached_states:
-        return cached_states[(board, color)]
-        
-    possible_moves = get_possible_moves(board, color)
-    if not possible_moves or limit == 0:
-        return (None, compute_utility(board, color))
-    
-    best_move, best_utility = None, float('inf')
-    for move in possible_moves:
-        new_board = play_move(board, color, move[0], move[1])
-        _, utility = minimax_max_node(new_board, 3-color, limit-1, caching)
-        if not best_move or utility < best_utility:
-            best_move, best_utility = move, utility
+# Both searches are written in negamax form: every node returns its utility
+# for color, the player to move, so a child's utility is negated on the way up.
+# color ^ 3 is the color of the other player.
+# Moves are made without copying the board: the child's disks only differ by
+# the placed and flipped disks, so they are XORed into the arguments of the
+# recursive call. own, opp and h are left untouched, so there is nothing to
+# undo once the call returns.
+def minimax_node(own, opp, h, n, color, limit, caching = 0): #returns highest possible utility for color
     
     if caching == 1:
-        cached_states[(board, color)] = (best_move, best_utility)
-               
-    return best_move, best_utility
-
-def minimax_max_node(board, color, limit, caching = 0): #returns highest possible utility
+        entry = cached_states[h & TT_MASK]
+        if entry is not None and entry[0] == h and entry[1] >= limit and entry[3] == EXACT:
+            return entry[4], entry[2]
     
-    if caching == 1 and (board, color) in cached_states:
-        return cached_states[(board, color)]
-    
-    possible_moves = get_possible_moves(board, color)
+    possible_moves = get_possible_moves_bb(own, opp, n)
     if not possible_moves or limit == 0:
-        return (None, compute_utility(board, color))
+        return (None, own.bit_count() - opp.bit_count())
     
-    best_move, best_utility = None, float('-inf')
-    for move in possible_moves:
-        new_board = play_move(board, color, move[0], move[1])
-        _, utility = minimax_min_node(new_board, 3-color, limit-1, caching)
-        if not best_move or utility > best_utility:
+    best_move, best_utility = None, -INF
+    flip_keys, move_keys = zobrist_keys[n][0], zobrist_keys[n][color]
+    for move in iter_squares(possible_moves):
+        flips = find_flips_bb(own, opp, n, move)
+        new_h = h ^ SIDE_KEY ^ move_keys[move]
+        for flipped in iter_squares(flips):
+            new_h ^= flip_keys[flipped]
+        _, utility = minimax_node(opp ^ flips, own | flips | 1 << move, new_h, n, color ^ 3, limit-1, caching)
+        utility = -utility
+        if utility > best_utility:
             best_move, best_utility = move, utility
     
     if caching == 1:
-        cached_states[(board, color)] = (best_move, best_utility)
+        store_state(h, limit, best_utility, EXACT, best_move)
     
     return best_move, best_utility
     
@@ -129,68 +186,138 @@ def select_move_minimax(board, color, limit, caching = 0):
     If caching is ON (i.e. 1), use state caching to reduce the number of state evaluations.
     If caching is OFF (i.e. 0), do NOT use state caching to reduce the number of state evaluations.    
     """
-    move, _ = minimax_max_node(board, color, limit, caching)
+    n = len(board)
+    dark, light = get_bitboards(board)
+    return to_move(choose_move_minimax(dark, light, n, color, limit, caching), n)
+
+# Same as select_move_minimax, on a board given as bitboards. Returns a square.
+def choose_move_minimax(dark, light, n, color, limit, caching = 0):
+    own, opp = (dark, light) if color == 1 else (light, dark)
+    h = get_hash(dark, light, n, color)
+    if limit < 0: # no depth limit: the game is over once the empty squares are filled
+        limit = n * n - (dark | light).bit_count()
+    ensure_recursion_limit(limit)
+    move, _ = minimax_node(own, opp, h, n, color, limit, caching)
     return move
 
 ############ ALPHA-BETA PRUNING #####################
-def alphabeta_min_node(board, color, alpha, beta, limit, caching = 0, ordering = 0):
-    
-    if caching == 1 and (board, color, alpha, beta) in cached_states:
-        return cached_states[(board, color, alpha, beta)]
-    
-    possible_moves = get_possible_moves(board, color)
-    if not possible_moves or limit == 0:
-        return (None, compute_utility(board, color))
-        
-    if ordering == 1:
-        possible_moves = sorted(possible_moves, key = lambda x: compute_utility(play_move(board, color, x[0], x[1]), color))
-    
-    best_move, best_utility = None, float('inf')
-    for move in possible_moves:
-        new_board = play_move(board, color, move[0], move[1])
-        _, utility = alphabeta_max_node(new_board, 3-color, alpha, beta, limit-1, caching, ordering)
-        if not best_move or utility < best_utility:
-            best_move, best_utility = move, utility
-        
-        if beta > best_utility:
-            beta = best_utility
-            if beta <= alpha:
-                break
-                
-    if caching == 1:
-        cached_states[(board, color, alpha, beta)] = (best_move, best_utility)
-        
-    return best_move, best_utility
+# Node ordering ranks moves without playing them, from three sources:
+# - the best move found by the previous, shallower iteration (cached_states)
+# - killer moves: the last two moves that caused a cutoff at the same ply.
+#   Every move adds one disk, so the number of disks on the board is the ply.
+# - the history score of each square: the sum of depth*depth over the cutoffs
+#   the square caused for a color, kept for the whole game
+move_ordering = {}
+
+# Return the (killers, history) tables of a board of dimension n:
+# killers[ply] is a [move, move] list and history[color][square] a score
+def get_move_ordering(n):
+    if n not in move_ordering:
+        killers = [[None, None] for _ in range(n * n + 1)]
+        history = [None, [0] * (n * n), [0] * (n * n)]
+        move_ordering[n] = (killers, history)
+    return move_ordering[n]
 
-def alphabeta_max_node(board, color, alpha, beta, limit, caching = 0, ordering = 0):
+# Yield the squares of the moves bitboard: first, then the killers, then the
+# rest by decreasing history score. Moves are only produced when asked for,
+# so nothing is wasted after a cutoff.
+def ordered_moves(moves, first, killers, history):
+    if first is not None and moves >> first & 1:
+        yield first
+        moves ^= 1 << first
+    for killer in killers:
+        if killer is not None and moves >> killer & 1:
+            yield killer
+            moves ^= 1 << killer
+    yield from sorted(iter_squares(moves), key = history.__getitem__, reverse = True)
+
+def alphabeta_node(own, opp, h, n, color, alpha, beta, limit, caching = 0, ordering = 0):
     
-    if caching == 1 and (board, color, alpha, beta) in cached_states:
-        return cached_states[(board, color, alpha, beta)]
+    if stop_pondering:
+        raise SearchStopped
     
-    possible_moves = get_possible_moves(board, color)
+    entry = cached_states[h & TT_MASK] if caching == 1 or ordering == 1 else None
+    if entry is not None and entry[0] != h:
+        entry = None
+    if caching == 1 and entry is not None and entry[1] >= limit:
+        _, depth, value, flag, move = entry
+        if flag == EXACT:
+            return move, value
+        elif flag == LOWER:
+            alpha = max(alpha, value)
+        else:
+            beta = min(beta, value)
+        if alpha >= beta:
+            return move, value
+    alpha_orig, beta_orig = alpha, beta
+    
+    possible_moves = get_possible_moves_bb(own, opp, n)
     if not possible_moves or limit == 0:
-        return (None, compute_utility(board, color))
+        return (None, own.bit_count() - opp.bit_count())
     
     if ordering == 1:
-        possible_moves = sorted(possible_moves, key = lambda x: -compute_utility(play_move(board, color, x[0], x[1]), color))
+        killers, history = move_ordering[n]
+        killers, history = killers[(own | opp).bit_count()], history[color]
+        possible_moves = ordered_moves(possible_moves, entry[4] if entry is not None else None, killers, history)
+    else:
+        possible_moves = iter_squares(possible_moves)
     
-    best_move, best_utility = None, float('-inf')
+    best_move, best_utility = None, -INF
+    flip_keys, move_keys = zobrist_keys[n][0], zobrist_keys[n][color]
     for move in possible_moves:
-        new_board = play_move(board, color, move[0], move[1])
-        _, utility = alphabeta_min_node(new_board, 3-color, alpha, beta, limit-1, caching, ordering)
-        if not best_move or utility > best_utility:
+        flips = find_flips_bb(own, opp, n, move)
+        new_h = h ^ SIDE_KEY ^ move_keys[move]
+        for flipped in iter_squares(flips):
+            new_h ^= flip_keys[flipped]
+        _, utility = alphabeta_node(opp ^ flips, own | flips | 1 << move, new_h, n, color ^ 3, -beta, -alpha, limit-1, caching, ordering)
+        utility = -utility
+        if utility > best_utility:
             best_move, best_utility = move, utility
         
         if alpha < best_utility:
             alpha = best_utility
             if beta <= alpha:
+                if ordering == 1:
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                    history[move] += limit * limit
                 break
     
-    if caching == 1:
-        cached_states[(board, color, alpha, beta)] = (best_move, best_utility)
+    if caching == 1 or ordering == 1:
+        if best_utility <= alpha_orig:
+            flag = UPPER
+        elif best_utility >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        store_state(h, limit, best_utility, flag, best_move)
          
     return best_move, best_utility
 
+# Search the root with its moves tried in the order of root_moves, a list of
+# (move, child_own, child_opp, child_h) built once for all the iterations.
+# child_own is the disks of the player to move in the child. The root window
+# is never narrowed from above, so the result is always exact.
+def alphabeta_root(h, n, color, root_moves, limit, caching = 0, ordering = 0):
+    
+    if caching == 1:
+        entry = cached_states[h & TT_MASK]
+        if entry is not None and entry[0] == h and entry[1] >= limit and entry[3] == EXACT:
+            return entry[4], entry[2]
+    
+    best_move, best_utility = None, -INF
+    for move, child_own, child_opp, child_h in root_moves:
+        _, utility = alphabeta_node(child_own, child_opp, child_h, n, color ^ 3, -INF, -best_utility, limit-1, caching, ordering)
+        utility = -utility
+        if utility > best_utility:
+            best_move, best_utility = move, utility
+    
+    if best_move is not None:
+        store_state(h, limit, best_utility, EXACT, best_move)
+    
+    return best_move, best_utility
+
 def select_move_alphabeta(board, color, limit, caching = 0, ordering = 0):
     """
     Given a board and a player color, decide on a move. 
@@ -206,9 +333,88 @@ def select_move_alphabeta(board, color, limit, caching = 0, ordering = 0):
     If ordering is ON (i.e. 1), use node ordering to expedite pruning and reduce the number of state evaluations. 
     If ordering is OFF (i.e. 0), do NOT use node ordering to expedite pruning and reduce the number of state evaluations. 
     """
-    move, _ = alphabeta_max_node(board, color, float('-inf'), float('inf'), limit, caching, ordering)
+    n = len(board)
+    dark, light = get_bitboards(board)
+    return to_move(choose_move_alphabeta(dark, light, n, color, limit, caching, ordering), n)
+
+# Same as select_move_alphabeta, on a board given as bitboards. Returns a square.
+def choose_move_alphabeta(dark, light, n, color, limit, caching = 0, ordering = 0):
+    get_move_ordering(n)
+    own, opp = (dark, light) if color == 1 else (light, dark)
+    h = get_hash(dark, light, n, color)
+    if limit < 0: # no depth limit: the game is over once the empty squares are filled
+        limit = n * n - (dark | light).bit_count()
+    ensure_recursion_limit(limit)
+
+    # Every search of the root goes through alphabeta_root, which never lets a
+    # cached bound narrow the root window: with a raised alpha, a worse move
+    # could fail high and be returned with the bound as its utility.
+    # Play every root move once and keep the children for all the iterations.
+    root_moves = []
+    flip_keys, move_keys = zobrist_keys[n][0], zobrist_keys[n][color]
+    for move in iter_squares(get_possible_moves_bb(own, opp, n)):
+        flips = find_flips_bb(own, opp, n, move)
+        child_h = h ^ SIDE_KEY ^ move_keys[move]
+        for flipped in iter_squares(flips):
+            child_h ^= flip_keys[flipped]
+        root_moves.append((move, opp ^ flips, own | flips | 1 << move, child_h))
+    
+    if ordering == 0:
+        move, _ = alphabeta_root(h, n, color, root_moves, limit, caching, ordering)
+        return move
+    
+    # Iterative deepening: every iteration stores the best move of each state
+    # in cached_states, which the next iteration then searches first. At the
+    # root, the best move is moved to the front of root_moves.
+    move = None
+    for depth in range(1, limit + 1):
+        move, _ = alphabeta_root(h, n, color, root_moves, depth, caching, ordering)
+        if move is None:
+            break
+        for k, child in enumerate(root_moves):
+            if child[0] == move:
+                root_moves.insert(0, root_moves.pop(k))
+                break
     return move
 
+############ PONDERING #############################
+# While the opponent thinks, the AI keeps searching the position it left them
+# in on a background thread. The results land in cached_states, so the search
+# for our next move starts from a warm table. The main thread only waits on
+# input() meanwhile, which releases the interpreter to the ponder thread.
+class SearchStopped(Exception):
+    pass
+
+stop_pondering = False
+
+def ponder(own, opp, h, n, color, limit, caching, ordering):
+    try:
+        for depth in range(1, limit + 1):
+            alphabeta_node(own, opp, h, n, color, -INF, INF, depth, caching, ordering)
+    except SearchStopped: # unfinished nodes are never stored, so the table stays valid
+        pass
+
+# Start pondering on the board after color played square. limit is the depth
+# limit of our own searches: searching one ply deeper from the opponent's
+# position stores our replies at the depth our next search needs.
+def start_pondering(dark, light, n, color, square, limit, caching, ordering):
+    get_move_ordering(n)
+    own, opp = (dark, light) if color == 1 else (light, dark)
+    own, opp = play_move_bb(own, opp, n, square)
+    dark, light = (own, opp) if color == 1 else (opp, own)
+    empty = n * n - (dark | light).bit_count()
+    limit = empty if limit < 0 else min(limit + 1, empty)
+    ensure_recursion_limit(limit)
+    thread = threading.Thread(target=ponder, args=(opp, own, get_hash(dark, light, n, color ^ 3), n, color ^ 3, limit, caching, ordering), daemon=True)
+    thread.start()
+    return thread
+
+def stop_pondering_thread(thread):
+    global stop_pondering
+    stop_pondering = True
+    thread.join()
+    stop_pondering = False
+
 ####################################################
 def run_ai():
     """
@@ -218,6 +424,7 @@ def run_ai():
     until the game is over.
     """
     print("Othello AI") # First line is the name of this AI
+    clear_cached_states()
     arguments = input().split(",")
     
     color = int(arguments[0]) #Player color: 1 for dark (goes first), 2 for light. 
@@ -240,11 +447,18 @@ def run_ai():
 
     if (minimax == 1 and ordering == 1): eprint("Node Ordering should have no impact on Minimax")
 
+    # Pondering only pays off through the table, so it needs caching or ordering
+    ponder_thread = None
+    can_ponder = minimax == 0 and (caching == 1 or ordering == 1)
+
     while True: # This is the main loop
         # Read in the current game status, for example:
         # "SCORE 2 2" or "FINAL 33 31" if the game is over.
         # The first number is the score for player 1 (dark), the second for player 2 (light)
         next_input = input()
+        if ponder_thread is not None:
+            stop_pondering_thread(ponder_thread)
+            ponder_thread = None
         status, dark_score_s, light_score_s = next_input.strip().split()
         dark_score = int(dark_score_s)
         light_score = int(light_score_s)
@@ -252,20 +466,24 @@ def run_ai():
         if status == "FINAL": # Game is over.
             print
         else:
-            board = eval(input()) # Read in the input and turn it into a Python
-                                  # object. The format is a list of rows. The
-                                  # squares in each row are represented by
-                                  # 0 : empty square
-                                  # 1 : dark disk (player 1)
-                                  # 2 : light disk (player 2)
+            dark, light, n = parse_bitboards(input()) # Read in the input and turn it into
+                                                      # bitboards. The format is a list of
+                                                      # rows. The squares in each row are
+                                                      # represented by
+                                                      # 0 : empty square
+                                                      # 1 : dark disk (player 1)
+                                                      # 2 : light disk (player 2)
 
             # Select the move and send it to the manager
             if (minimax == 1): #run this if the minimax flag is given
-                movei, movej = select_move_minimax(board, color, limit, caching)
+                move = choose_move_minimax(dark, light, n, color, limit, caching)
             else: #else run alphabeta
-                movei, movej = select_move_alphabeta(board, color, limit, caching, ordering)
+                move = choose_move_alphabeta(dark, light, n, color, limit, caching, ordering)
             
-            print("{} {}".format(movei, movej))
+            movei, movej = to_move(move, n)
+            print("{} {}".format(movei, movej), flush=True)
+            if can_ponder:
+                ponder_thread = start_pondering(dark, light, n, color, move, limit, caching, ordering)
 
 if __name__ == "__main__":
     run_ai()
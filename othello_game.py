@@ -107,7 +107,7 @@ class OthelloGameManager(object):
         final = []
         for row in board: 
             final.append(tuple(row))
-        return board
+        return tuple(final)
 
     def print_board(self):
         for row in self.board: 
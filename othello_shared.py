@@ -6,6 +6,9 @@ building your AIs.
 Thanks to original author Daniel Bauer, Columbia University
 """
 
+import math
+import re
+
 def find_lines(board, i, j, player):
     """
     Find all the uninterupted lines of stones that would be captured if player
@@ -74,3 +77,161 @@ def get_score(board):
             elif board[i][j] == 2:
                 p2_count += 1
     return p1_count, p2_count
+
+############ BITBOARDS ###############################
+# A board of dimension n can also be stored as a pair of integers (dark, light).
+# Bit j*n + i of an integer is set when the disk at column i, row j belongs to
+# that player. Counting and masking disks then only takes a few integer ops.
+
+def get_bitboards(board):
+    """
+    Convert a board (a list of rows) into a (dark, light) pair of bitboards.
+    """
+    n = len(board)
+    dark = 0
+    light = 0
+    for j in range(n):
+        for i in range(n):
+            if board[j][i] == 1:
+                dark |= 1 << (j * n + i)
+            elif board[j][i] == 2:
+                light |= 1 << (j * n + i)
+    return dark, light
+
+def parse_bitboards(text):
+    """
+    Parse a board printed as a list of rows, the way the game manager sends
+    it, directly into (dark, light, n) without building the board first.
+    """
+    # Square k of the board is the k-th digit of the text. Reversed, the
+    # digits read as a base-2 number once the other color is zeroed out.
+    digits = re.sub("[^012]", "", text)[::-1]
+    n = math.isqrt(len(digits))
+    dark = int("0" + digits.replace("2", "0"), 2)
+    light = int("0" + digits.replace("1", "0").replace("2", "1"), 2)
+    return dark, light, n
+
+def get_region_masks(n):
+    """
+    Return the (corner, edge, interior) masks of a board of dimension n.
+    Edges do not include the corners.
+    """
+    if n not in region_masks:
+        full = (1 << (n * n)) - 1
+        corner = 1 | 1 << (n - 1) | 1 << (n * (n - 1)) | 1 << (n * n - 1)
+        rim = 0
+        for k in range(n):
+            rim |= 1 << k                    # top row
+            rim |= 1 << (n * (n - 1) + k)    # bottom row
+            rim |= 1 << (k * n)              # left column
+            rim |= 1 << (k * n + n - 1)      # right column
+        edge = rim & ~corner
+        interior = full & ~rim
+        region_masks[n] = (corner, edge, interior)
+    return region_masks[n]
+
+region_masks = {}
+
+def iter_squares(bb):
+    """
+    Yield the index of every set bit of bitboard bb, lowest first.
+    """
+    while bb:
+        low = bb & -bb
+        bb ^= low
+        yield low.bit_length() - 1
+
+def get_directions(n):
+    """
+    Return (full, left, right) for a board of dimension n. full has a bit set
+    for every square. left and right hold the (shift, mask) pairs of the
+    directions moving towards higher and lower squares: a bitboard bb steps
+    once in a direction with (bb & mask) << shift or (bb & mask) >> shift.
+    The masks clear the squares that would otherwise wrap around the board.
+    """
+    if n not in directions:
+        full = (1 << (n * n)) - 1
+        first_col = last_col = 0
+        for k in range(n):
+            first_col |= 1 << (k * n)
+            last_col |= 1 << (k * n + n - 1)
+        first_row = (1 << n) - 1
+        last_row = first_row << (n * (n - 1))
+        not_first_col = full & ~first_col
+        not_last_col = full & ~last_col
+        not_first_row = full & ~first_row
+        not_last_row = full & ~last_row
+        left = [(1, not_last_col),                       # right
+                (n, not_last_row),                       # down
+                (n + 1, not_last_row & not_last_col),    # down-right
+                (n - 1, not_last_row & not_first_col)]   # down-left
+        right = [(1, not_first_col),                     # left
+                 (n, not_first_row),                     # up
+                 (n + 1, not_first_row & not_first_col), # up-left
+                 (n - 1, not_first_row & not_last_col)]  # up-right
+        directions[n] = (full, left, right)
+    return directions[n]
+
+directions = {}
+
+def find_flips_bb(own, opp, n, square):
+    """
+    Return the bitboard of opponent disks that would be captured if the owner
+    of own plays square.
+    """
+    _, left, right = get_directions(n)
+    move = 1 << square
+    flips = 0
+    for shift, mask in left:
+        x = (move & mask) << shift
+        line = 0
+        while x & opp:
+            line |= x
+            x = (x & mask) << shift
+        if x & own:
+            flips |= line
+    for shift, mask in right:
+        x = (move & mask) >> shift
+        line = 0
+        while x & opp:
+            line |= x
+            x = (x & mask) >> shift
+        if x & own:
+            flips |= line
+    return flips
+
+def get_possible_moves_bb(own, opp, n):
+    """
+    Return a bitboard of all the empty squares where the owner of own can play.
+    Every direction is handled for all the disks of own at once: the run of
+    opponent disks next to own is grown one step at a time, and the empty
+    squares right past the end of a run are legal moves.
+    """
+    full, left, right = get_directions(n)
+    empty = full & ~(own | opp)
+    moves = 0
+    for shift, mask in left:
+        x = opp & ((own & mask) << shift)
+        run = x
+        while x:
+            x = opp & ((x & mask) << shift)
+            run |= x
+        moves |= empty & ((run & mask) << shift)
+    for shift, mask in right:
+        x = opp & ((own & mask) >> shift)
+        run = x
+        while x:
+            x = opp & ((x & mask) >> shift)
+            run |= x
+        moves |= empty & ((run & mask) >> shift)
+    return moves
+
+def play_move_bb(own, opp, n, square):
+    """
+    Play square for the owner of own and return the new (own, opp) pair.
+    """
+    flips = find_flips_bb(own, opp, n, square)
+    return own | flips | 1 << square, opp & ~flips
+
+def get_score_bb(dark, light):
+    return dark.bit_count(), light.bit_count()
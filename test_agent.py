@@ -0,0 +1,81 @@
+"""
+Regression checks for the AI in agent.py. Run with: python3 -m unittest
+"""
+
+import random
+import unittest
+
+import agent
+from othello_game import OthelloGameManager
+from othello_shared import find_flips_bb, get_bitboards, get_possible_moves, play_move
+
+# Utility for color of playing move (i, j) on board, searched without the
+# transposition table to depth limit
+def move_utility(board, color, move, limit):
+    n = len(board)
+    dark, light = get_bitboards(board)
+    own, opp = (dark, light) if color == 1 else (light, dark)
+    square = move[1] * n + move[0]
+    flips = find_flips_bb(own, opp, n, square)
+    _, utility = agent.minimax_node(opp ^ flips, own | flips | 1 << square, 0, n, color ^ 3, limit - 1, 0)
+    return -utility
+
+# Random positions reached by playing random moves, with the color to move
+def random_positions(n, count, seed):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = OthelloGameManager(n)
+        for _ in range(rng.randrange(1, n * n // 2)):
+            moves = game.get_possible_moves()
+            if not moves:
+                break
+            game.play(*rng.choice(moves))
+        if game.get_possible_moves():
+            positions.append((game.board, game.current_player))
+    return positions
+
+class PonderingTest(unittest.TestCase):
+
+    def test_move_after_pondering_matches_uncached_search(self):
+        # Pondering stores our replies as bounds at exactly the depth of our
+        # next search. The move chosen on a warm table must be as good as the
+        # one an uncached search finds.
+        limit = 3
+        for caching, ordering in ((1, 0), (1, 1), (0, 1)):
+            for board, color in random_positions(6, 30, seed = 384):
+                # As in run_ai: play our move, ponder until the thread has
+                # searched its full depth, then search after the reply
+                agent.clear_cached_states()
+                n = len(board)
+                i, j = get_possible_moves(board, color)[0]
+                dark, light = get_bitboards(board)
+                agent.start_pondering(dark, light, n, color, j * n + i, limit, caching, ordering).join()
+                board = play_move(board, color, i, j)
+                for reply in get_possible_moves(board, color ^ 3):
+                    after = play_move(board, color ^ 3, *reply)
+                    moves = get_possible_moves(after, color)
+                    if not moves:
+                        continue
+                    move = agent.select_move_alphabeta(after, color, limit, caching, ordering)
+                    best = max(move_utility(after, color, m, limit) for m in moves)
+                    self.assertEqual(move_utility(after, color, move, limit), best)
+
+    def test_move_after_pondering_with_tight_root_bound(self):
+        # When our reply failed high in the pondering search, its utility is
+        # stored as a lower bound for our root, and it can equal the true
+        # value. The bound must not narrow the root window: a worse move could
+        # fail high against it and be returned.
+        limit = 3
+        for board, color in random_positions(6, 60, seed = 611):
+            agent.clear_cached_states()
+            n = len(board)
+            moves = get_possible_moves(board, color)
+            best = max(move_utility(board, color, m, limit) for m in moves)
+            dark, light = get_bitboards(board)
+            agent.store_state(agent.get_hash(dark, light, n, color), limit, best, agent.LOWER, None)
+            move = agent.select_move_alphabeta(board, color, limit, 1, 0)
+            self.assertEqual(move_utility(board, color, move, limit), best)
+
+if __name__ == "__main__":
+    unittest.main()